@@ -5,25 +5,37 @@
 
 import os
 import io
-import json
+import binascii
+import time
+import hashlib
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
 import requests
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+import orjson
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from cryptography.exceptions import InvalidSignature
 from discord import Embed, Color
-from supabase import create_client, Client
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+# matplotlib, numpy e supabase são importados sob demanda (ver get_supabase e _get_dashboard_figure):
+# PING e navegação do catálogo não usam nenhum deles e o cold start no Render fica bem mais leve.
 
 # --- Configuração do App Flask ---
+class ORJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask baseado em orjson (usado por request.json, jsonify e respostas de erro)."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # --- Carregamento de Variáveis de Ambiente ---
 try:
@@ -37,10 +49,39 @@ except KeyError as e:
     raise RuntimeError(f"ERRO: A variável de ambiente '{e.args[0]}' não foi definida no Render.")
 
 # --- Conexões e Clientes ---
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-verify_key = VerifyKey(bytes.fromhex(DISCORD_PUBLIC_KEY))
+_supabase = None
+
+def get_supabase():
+    """Cria o cliente do Supabase no primeiro uso."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+verify_key = Ed25519PublicKey.from_public_bytes(bytes.fromhex(DISCORD_PUBLIC_KEY))
 BASE_DISCORD_API_URL = "https://discord.com/api/v10"
 AUTH_HEADERS = {"Authorization": f"Bot {DISCORD_BOT_TOKEN}"}
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def _build_session(headers: dict) -> requests.Session:
+    """Cria uma sessão HTTP com pool de conexões keep-alive para a API do Discord."""
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=50, pool_block=False))
+    return session
+
+# Chamadas do bot levam o token; os webhooks de interação são autenticados pelo próprio token da URL
+DISCORD_SESSION = _build_session(AUTH_HEADERS)
+WEBHOOK_SESSION = _build_session({})
+
+# Pool compartilhado para as ações em segundo plano, em vez de uma thread nova por interação
+EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix='disc-work')
+# O dashboard (matplotlib) roda num pool próprio e pequeno, para que vários /dashboard seguidos não atrasem compras e pedidos
+DASHBOARD_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='disc-dash')
+# Chamadas paralelas disparadas de dentro de um handler. Ficam num pool separado para que um handler
+# que espera suas subtarefas nunca ocupe os workers de que elas dependem.
+FANOUT_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix='disc-fanout')
 
 # --- Definição dos Produtos ---
 PRODUTOS = {
@@ -72,33 +113,125 @@ PRODUTOS = {
 
 # --- Funções Auxiliares e de Geração de Views ---
 
+# Respostas fixas de interação, serializadas uma única vez
+PONG_BYTES = b'{"type":1}'
+DEFERRED_MESSAGE_BYTES = orjson.dumps({"type": 5, "data": {"flags": 64}})
+DEFERRED_UPDATE_BYTES = orjson.dumps({"type": 6})
+NO_PERMISSION_BYTES = orjson.dumps({"type": 4, "data": {"content": "❌ Você não tem permissão.", "flags": 64}})
+UNKNOWN_INTERACTION_BYTES = orjson.dumps({"type": 4, "data": {"content": "Interação não reconhecida.", "flags": 64}})
+
+def json_bytes(body: bytes) -> Response:
+    """Devolve um corpo JSON já serializado."""
+    return Response(body, mimetype='application/json')
+
+def ojson(payload) -> Response:
+    """Serializa a resposta com orjson, evitando o encoder json da stdlib usado pelo jsonify."""
+    return json_bytes(orjson.dumps(payload))
+
+def defer(body: bytes, handler, *args, executor: ThreadPoolExecutor = EXECUTOR) -> Response:
+    """Responde ao Discord e só agenda handler(*args) depois que a resposta foi enviada."""
+    response = json_bytes(body)
+    response.call_on_close(lambda: executor.submit(handler, *args))
+    return response
+
 def is_admin(interaction: dict) -> bool:
     if 'member' not in interaction or 'roles' not in interaction['member']:
         return False
     return str(ADMIN_ROLE_ID) in interaction['member']['roles']
 
-def build_pending_orders_view(page=0):
+def _build_catalog_page(page: int) -> dict:
+    """Monta o embed e os botões de uma página do catálogo."""
+    products_list = list(PRODUTOS.values())
+    product = products_list[page]
+    embed = Embed(title=product['name'], color=Color.from_str("#5865F2"))
+    embed.add_field(name="💰 Preço", value=f"**`{product['price_display']}`**", inline=True)
+    embed.add_field(name="📦 O que você recebe?", value="Código-fonte completo", inline=True)
+    embed.add_field(name="📄 Descrição", value=product['description'], inline=False)
+    embed.set_image(url=product['image_url'])
+    embed.set_footer(text=f"Página {page + 1} de {len(products_list)}")
+    components = [
+        {"type": 1, "components": [
+            {"type": 2, "style": 3, "label": "Comprar este Item", "emoji": {"name": "🛒"}, "custom_id": f"buy_{product['id']}"}
+        ]},
+        {"type": 1, "components": [
+            {"type": 2, "style": 2, "emoji": {"name": "⬅️"}, "custom_id": f"catalog_prev_{page}", "disabled": page == 0},
+            {"type": 2, "style": 2, "emoji": {"name": "➡️"}, "custom_id": f"catalog_next_{page}", "disabled": page >= len(products_list) - 1}
+        ]}
+    ]
+    return {"embeds": [embed.to_dict()], "components": components}
+
+# Preço por produto, usado na agregação do dashboard
+PRICES = {pid: p['price_value'] for pid, p in PRODUTOS.items()}
+
+# O catálogo é estático: as páginas (e a resposta de navegação já serializada) são montadas uma única vez
+CATALOG_PAGES = [_build_catalog_page(i) for i in range(len(PRODUTOS))]
+CATALOG_PAGES_BYTES = [orjson.dumps({"type": 7, "data": p}) for p in CATALOG_PAGES]
+COMPRAR_RESPONSE_BYTES = orjson.dumps({"type": 4, "data": {**CATALOG_PAGES[0], "flags": 64}})
+# Resposta de navegação já resolvida para cada custom_id de catálogo válido (uma busca em dict por clique)
+CATALOG_NAV = {}
+for _page in range(len(CATALOG_PAGES)):
+    CATALOG_NAV[f"catalog_prev_{_page}"] = CATALOG_PAGES_BYTES[max(_page - 1, 0)]
+    CATALOG_NAV[f"catalog_next_{_page}"] = CATALOG_PAGES_BYTES[min(_page + 1, len(CATALOG_PAGES) - 1)]
+
+def _build_payment_template(product: dict) -> dict:
+    """Monta as partes fixas da mensagem de pagamento de um produto (sem pedido e cliente)."""
+    embed = Embed(color=Color.blue())
+    embed.set_image(url=product['image_url'])
+    components = [{"type": 1, "components": [{"type": 2, "style": 5, "label": "Pagar Agora", "url": product['payment_link']}]}]
+    return {"embed": embed.to_dict(), "components": components}
+
+# Só o número do pedido e o cliente mudam na mensagem de pagamento; o resto é montado uma vez por produto
+PAYMENT_TEMPLATES = {pid: _build_payment_template(p) for pid, p in PRODUTOS.items()}
+
+# Páginas de pedidos pendentes já consultadas: (user_id, página) -> (instante da consulta, pedido, total)
+_PENDING_CACHE = {}
+PENDING_CACHE_TTL = 15
+
+def get_pending_page(user_id: str, page: int, use_cache: bool = True) -> tuple:
+    """Busca só o pedido pendente da página pedida e o total de pendentes, paginando no banco."""
+    cached = _PENDING_CACHE.get((user_id, page)) if use_cache else None
+    if cached and time.monotonic() - cached[0] < PENDING_CACHE_TTL:
+        return cached[1], cached[2]
+    from postgrest.exceptions import APIError
+    try:
+        response = get_supabase().table('pedidos').select('id,created_at,product_name,user_name,user_id', count='exact').eq('status', 'pending_payment').order('id').range(page, page).execute()
+    except APIError as e:
+        # Com count='exact' o PostgREST recusa (416, PGRST103) um offset além do total, o que acontece quando a lista encolheu
+        if e.code != 'PGRST103':
+            raise
+        return None, 0
+    order = response.data[0] if response.data else None
+    _PENDING_CACHE[(user_id, page)] = (time.monotonic(), order, response.count or 0)
+    return order, response.count or 0
+
+def invalidate_pending_orders():
+    """Descarta as consultas em cache de todos os admins, p.ex. após confirmar/cancelar um pedido."""
+    _PENDING_CACHE.clear()
+
+def build_pending_orders_view(user_id: str, page=0):
     """Busca pedidos pendentes e constrói a view (embed e botões)."""
+    page = max(0, page)
     try:
-        response = supabase.table('pedidos').select('*').eq('status', 'pending_payment').order('id').execute()
-        pending_orders = response.data
+        order, total = get_pending_page(user_id, page)
+        if order is None and page > 0:
+            # A página não existe mais: mostra a última que ainda existe, consultando o banco (o total em cache pode estar velho)
+            _, total = get_pending_page(user_id, 0, use_cache=False)
+            page = max(0, total - 1)
+            order, total = get_pending_page(user_id, page, use_cache=False)
     except Exception as e:
         app.logger.error(f"Erro ao buscar pedidos pendentes: {e}")
         return {"content": "❌ Erro ao buscar os pedidos.", "embeds": [], "components": []}
 
-    if not pending_orders:
+    if order is None:
         return {"content": "✅ Não há pedidos pendentes no momento.", "embeds": [], "components": []}
 
-    page = max(0, min(page, len(pending_orders) - 1))
-    order = pending_orders[page]
-    
     created_at_dt = datetime.fromisoformat(order['created_at'].replace('Z', '+00:00'))
     timestamp_str = f"<t:{int(created_at_dt.timestamp())}:f>"
 
     embed = Embed(title=f"Pedido Pendente #{order['id']}", description=f"**Produto:** {order['product_name']}", color=Color.orange())
     embed.add_field(name="Cliente", value=f"{order.get('user_name', 'N/A')} (`{order.get('user_id', 'N/A')}`)", inline=False)
     embed.add_field(name="Data do Pedido", value=timestamp_str, inline=False)
-    embed.set_footer(text=f"Pedido {page + 1} de {len(pending_orders)}")
+    embed.set_footer(text=f"Pedido {page + 1} de {total}")
 
     components = [
         {"type": 1, "components": [
@@ -107,180 +240,296 @@ def build_pending_orders_view(page=0):
         ]},
         {"type": 1, "components": [
             {"type": 2, "style": 2, "emoji": {"name": "⬅️"}, "custom_id": f"pedidos_prev_{page}", "disabled": page == 0},
-            {"type": 2, "style": 2, "emoji": {"name": "➡️"}, "custom_id": f"pedidos_next_{page}", "disabled": page >= len(pending_orders) - 1}
+            {"type": 2, "style": 2, "emoji": {"name": "➡️"}, "custom_id": f"pedidos_next_{page}", "disabled": page >= total - 1}
         ]}
     ]
     return {"content": "", "embeds": [embed.to_dict()], "components": components}
 
 # --- Funções de Ações (executadas em threads) ---
 
-def handle_confirm_order(interaction: dict):
+def _log_if_failed(future):
+    """Registra no log a falha de uma chamada disparada sem espera."""
+    try:
+        future.result().raise_for_status()
+    except Exception as e:
+        app.logger.error(f"Erro ao enviar mensagem em segundo plano: {e}")
+
+def post_message_in_background(channel_id, payload: dict):
+    """Envia uma mensagem do bot num canal sem bloquear o handler."""
+    future = FANOUT_EXECUTOR.submit(DISCORD_SESSION.post, f"{BASE_DISCORD_API_URL}/channels/{channel_id}/messages", headers=JSON_HEADERS, data=orjson.dumps(payload))
+    future.add_done_callback(_log_if_failed)
+
+def build_already_processed_view(user_id: str, order_id: int, page: int) -> dict:
+    """View atualizada de pedidos pendentes, avisando que o pedido clicado já tinha sido confirmado/cancelado."""
+    view = build_pending_orders_view(user_id, page=page)
+    notice = f"ℹ️ O pedido #{order_id} já foi processado; a lista abaixo foi atualizada."
+    return {**view, "content": f"{notice}\n{view['content']}" if view['content'] else notice}
+
+def handle_confirm_order(interaction: dict, order_id: int, current_page: int):
     """Processa a confirmação de um pedido e atualiza a mensagem original."""
     token = interaction['token']
     original_message_url = f"{BASE_DISCORD_API_URL}/webhooks/{DISCORD_APP_ID}/{token}/messages/@original"
     
     try:
-        parts = interaction['data']['custom_id'].split('_')
-        order_id = int(parts[2])
-        current_page = int(parts[3])
-
-        supabase.table('pedidos').update({'status': 'completed'}).eq('id', order_id).execute()
-        
-        order_res = supabase.table('pedidos').select('product_id, product_name, thread_id, user_id').eq('id', order_id).single().execute()
-        order = order_res.data
+        # O update já devolve a linha atualizada (Prefer: return=representation), sem um select extra.
+        # O filtro de status impede que um botão de uma view desatualizada mexa num pedido já processado.
+        order_res = get_supabase().table('pedidos').update({'status': 'completed'}).eq('id', order_id).eq('status', 'pending_payment').execute()
+        invalidate_pending_orders()
+        if not order_res.data:
+            WEBHOOK_SESSION.patch(original_message_url, headers=JSON_HEADERS, data=orjson.dumps(build_already_processed_view(interaction['member']['user']['id'], order_id, current_page)))
+            return
+        invalidate_completed_orders()
+        order = order_res.data[0]
         product = PRODUTOS.get(order['product_id'])
         
         if order.get('thread_id') and product:
             embed = Embed(title="✅ Pagamento Confirmado!", description=f"Olá <@{order['user_id']}>, seu pagamento para o **{order['product_name']}** foi confirmado!\n\nObrigado pela compra. Abaixo está o link para download.", color=Color.green())
             view = {"type": 1, "components": [{"type": 2, "style": 5, "label": "Clique aqui para Baixar", "url": product['download_link']}]}
-            requests.post(f"{BASE_DISCORD_API_URL}/channels/{order['thread_id']}/messages", headers=AUTH_HEADERS, json={"embeds": [embed.to_dict()], "components": [view]})
+            # O aviso na thread segue em paralelo com a atualização da mensagem do admin
+            post_message_in_background(order['thread_id'], {"embeds": [embed.to_dict()], "components": [view]})
         
         # Atualiza a mensagem de pedidos com a lista atualizada
-        new_view_data = build_pending_orders_view(page=current_page)
-        requests.patch(original_message_url, json=new_view_data)
+        new_view_data = build_pending_orders_view(interaction['member']['user']['id'], page=current_page)
+        WEBHOOK_SESSION.patch(original_message_url, headers=JSON_HEADERS, data=orjson.dumps(new_view_data))
 
     except Exception as e:
         app.logger.error(f"Erro ao confirmar pedido {order_id}: {e}")
-        requests.patch(original_message_url, json={"content": f"❌ Erro ao confirmar o pedido #{order_id}."})
+        WEBHOOK_SESSION.patch(original_message_url, headers=JSON_HEADERS, data=orjson.dumps({"content": f"❌ Erro ao confirmar o pedido #{order_id}."}))
 
-def handle_cancel_order(interaction: dict):
+def handle_cancel_order(interaction: dict, order_id: int, current_page: int):
     """Processa o cancelamento de um pedido e atualiza a mensagem original."""
     token = interaction['token']
     original_message_url = f"{BASE_DISCORD_API_URL}/webhooks/{DISCORD_APP_ID}/{token}/messages/@original"
 
     try:
-        parts = interaction['data']['custom_id'].split('_')
-        order_id = int(parts[2])
-        current_page = int(parts[3])
-
-        supabase.table('pedidos').update({'status': 'cancelled'}).eq('id', order_id).execute()
-        
-        order_res = supabase.table('pedidos').select('product_name, thread_id, user_id').eq('id', order_id).single().execute()
-        order = order_res.data
+        order_res = get_supabase().table('pedidos').update({'status': 'cancelled'}).eq('id', order_id).eq('status', 'pending_payment').execute()
+        invalidate_pending_orders()
+        if not order_res.data:
+            WEBHOOK_SESSION.patch(original_message_url, headers=JSON_HEADERS, data=orjson.dumps(build_already_processed_view(interaction['member']['user']['id'], order_id, current_page)))
+            return
+        order = order_res.data[0]
         
         if order.get('thread_id'):
-            requests.post(f"{BASE_DISCORD_API_URL}/channels/{order['thread_id']}/messages", headers=AUTH_HEADERS, json={"content": f"Olá <@{order['user_id']}>, infelizmente seu pedido para o produto **{order['product_name']}** foi cancelado por um administrador."})
+            post_message_in_background(order['thread_id'], {"content": f"Olá <@{order['user_id']}>, infelizmente seu pedido para o produto **{order['product_name']}** foi cancelado por um administrador."})
             
-        new_view_data = build_pending_orders_view(page=current_page)
-        requests.patch(original_message_url, json=new_view_data)
+        new_view_data = build_pending_orders_view(interaction['member']['user']['id'], page=current_page)
+        WEBHOOK_SESSION.patch(original_message_url, headers=JSON_HEADERS, data=orjson.dumps(new_view_data))
 
     except Exception as e:
         app.logger.error(f"Erro ao cancelar pedido {order_id}: {e}")
-        requests.patch(original_message_url, json={"content": f"❌ Erro ao cancelar o pedido #{order_id}."})
+        WEBHOOK_SESSION.patch(original_message_url, headers=JSON_HEADERS, data=orjson.dumps({"content": f"❌ Erro ao cancelar o pedido #{order_id}."}))
 
-def handle_buy_action(interaction: dict):
+def handle_buy_action(interaction: dict, product_id: str):
     """Cria a thread de compra e envia uma resposta de acompanhamento."""
     token = interaction['token']
     followup_url = f"{BASE_DISCORD_API_URL}/webhooks/{DISCORD_APP_ID}/{token}/messages/@original"
     try:
-        product_id = interaction['data']['custom_id'].split('_', 1)[1]
         product = PRODUTOS.get(product_id)
         if not product:
-            requests.patch(followup_url, json={"content": "❌ Produto não encontrado."})
+            WEBHOOK_SESSION.patch(followup_url, headers=JSON_HEADERS, data=orjson.dumps({"content": "❌ Produto não encontrado."}))
             return
 
         user = interaction['member']['user']
         thread_url = f"{BASE_DISCORD_API_URL}/channels/{interaction['channel_id']}/threads"
-        thread_res = requests.post(thread_url, headers=AUTH_HEADERS, json={"name": f"🛒-compra-{user['username']}", "type": 12, "auto_archive_duration": 1440})
+        thread_res = DISCORD_SESSION.post(thread_url, headers=JSON_HEADERS, data=orjson.dumps({"name": f"🛒-compra-{user['username']}", "type": 12, "auto_archive_duration": 1440}))
         thread_res.raise_for_status()
         thread = thread_res.json()
         
-        requests.put(f"{BASE_DISCORD_API_URL}/channels/{thread['id']}/thread-members/{user['id']}", headers=AUTH_HEADERS)
+        # Adicionar o membro e registrar o pedido são independentes: o PUT roda em paralelo ao insert
+        member_future = FANOUT_EXECUTOR.submit(DISCORD_SESSION.put, f"{BASE_DISCORD_API_URL}/channels/{thread['id']}/thread-members/{user['id']}")
         
-        data, _ = supabase.table('pedidos').insert({'user_id': int(user['id']), 'user_name': user['username'], 'product_id': product['id'], 'product_name': product['name'], 'thread_id': int(thread['id']), 'status': 'pending_payment'}).execute()
+        res = get_supabase().table('pedidos').insert({'user_id': int(user['id']), 'user_name': user['username'], 'product_id': product['id'], 'product_name': product['name'], 'thread_id': int(thread['id']), 'status': 'pending_payment'}).execute()
+        order_id = res.data[0]['id']
+        invalidate_pending_orders()
         
-        embed = Embed(title=f"🛒 Pedido #{data[1][0]['id']}: {product['name']}", description=f"Olá <@{user['id']}>! Continue sua compra aqui.\n\n**Preço: {product['price_display']}**", color=Color.blue())
-        embed.set_image(url=product['image_url'])
-        message_payload = {"embeds": [embed.to_dict()], "components": [{"type": 1, "components": [{"type": 2, "style": 5, "label": "Pagar Agora", "url": product['payment_link']}]}]}
-        requests.post(f"{BASE_DISCORD_API_URL}/channels/{thread['id']}/messages", headers=AUTH_HEADERS, json=message_payload)
+        template = PAYMENT_TEMPLATES[product['id']]
+        embed = {**template['embed'], "title": f"🛒 Pedido #{order_id}: {product['name']}", "description": f"Olá <@{user['id']}>! Continue sua compra aqui.\n\n**Preço: {product['price_display']}**"}
+        message_payload = {"embeds": [embed], "components": template['components']}
+        message_future = FANOUT_EXECUTOR.submit(DISCORD_SESSION.post, f"{BASE_DISCORD_API_URL}/channels/{thread['id']}/messages", headers=JSON_HEADERS, data=orjson.dumps(message_payload))
         
-        requests.patch(followup_url, json={"content": f"✅ Criei um canal de compras privado para você! Clique aqui para finalizar: <#{thread['id']}>"})
+        # Só avisa o cliente depois que ele foi adicionado à thread e a mensagem de pagamento está lá
+        wait((member_future, message_future))
+        for future in (member_future, message_future):
+            future.result().raise_for_status()
+        
+        WEBHOOK_SESSION.patch(followup_url, headers=JSON_HEADERS, data=orjson.dumps({"content": f"✅ Criei um canal de compras privado para você! Clique aqui para finalizar: <#{thread['id']}>"}))
     except Exception as e:
         app.logger.error(f"Erro inesperado em handle_buy_action: {e}")
-        requests.patch(followup_url, json={"content": "❌ Ocorreu um erro inesperado ao processar sua compra."})
+        WEBHOOK_SESSION.patch(followup_url, headers=JSON_HEADERS, data=orjson.dumps({"content": "❌ Ocorreu um erro inesperado ao processar sua compra."}))
+
+# Figura do dashboard: criada uma vez (no primeiro uso) e reaproveitada; o lock serializa as renderizações.
+# Usa Figure + FigureCanvasAgg direto, sem o estado global do pyplot.
+_DASH_FIGURE = None
+_DASH_LOCK = threading.Lock()
+
+def _get_dashboard_figure():
+    """Cria a figura com tudo o que não depende dos dados (estilo, eixos, grid, títulos)."""
+    global _DASH_FIGURE
+    if _DASH_FIGURE is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        import matplotlib.dates as mdates
+        fig = Figure(figsize=(12, 7), dpi=120); canvas = FigureCanvasAgg(fig); ax = fig.add_subplot(111)
+        fig.patch.set_facecolor('#23272A'); ax.set_facecolor('#2C2F33')
+        ax.grid(axis='y', color='white', linestyle=':', linewidth=0.5, alpha=0.3, zorder=1)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m')); ax.xaxis.set_major_locator(mdates.DayLocator(interval=5))
+        ax.tick_params(axis='x', labelrotation=45, colors='white'); ax.tick_params(axis='y', colors='white')
+        for s in ['top', 'right']: ax.spines[s].set_visible(False)
+        for s in ['left', 'bottom']: ax.spines[s].set_color('#FFFFFF')
+        fig.suptitle('Dashboard de Vendas', fontsize=22, color='white', weight='bold')
+        ax.set_title('Receita nos Últimos 30 Dias', fontsize=14, color='#B9BBBE', pad=20)
+        _DASH_FIGURE = (fig, canvas, ax)
+    return _DASH_FIGURE
 
-# (A função create_dashboard_image não foi alterada e pode ser omitida por brevidade se necessário)
 def create_dashboard_image(completed_orders: list) -> io.BytesIO:
-    sales_by_day=defaultdict(float);end_date=datetime.now(timezone.utc);start_date=end_date-timedelta(days=30)
-    for o in completed_orders:
-        c=datetime.fromisoformat(o['created_at'].replace('Z','+00:00'))
-        if start_date<=c<=end_date:
-            p=o.get('product_id')
-            if p and p in PRODUTOS:sales_by_day[c.date()]+=PRODUTOS[p]['price_value']
-    dates=[start_date.date()+timedelta(days=i) for i in range(31)];sales=[sales_by_day[d] for d in dates];total_sales_count=len(completed_orders);total_revenue=sum(PRODUTOS[o['product_id']]['price_value'] for o in completed_orders if o['product_id'] in PRODUTOS)
-    plt.style.use('dark_background');fig,ax=plt.subplots(figsize=(12,7),dpi=120);fig.patch.set_facecolor('#23272A');ax.set_facecolor('#2C2F33');ax.bar(dates,sales,color='#5865F2',zorder=2);ax.grid(axis='y',color='white',linestyle=':',linewidth=0.5,alpha=0.3,zorder=1);ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'));ax.xaxis.set_major_locator(mdates.DayLocator(interval=5));plt.xticks(rotation=45,color='white');plt.yticks(color='white')
-    for s in['top','right']:ax.spines[s].set_visible(False)
-    for s in['left','bottom']:ax.spines[s].set_color('#FFFFFF')
-    fig.suptitle('Dashboard de Vendas',fontsize=22,color='white',weight='bold');ax.set_title('Receita nos Últimos 30 Dias',fontsize=14,color='#B9BBBE',pad=20);formatted_revenue=f"R$ {total_revenue:,.2f}".replace(',','v').replace('.',',').replace('v','.');props=dict(boxstyle='round,pad=0.5',facecolor='#23272A',alpha=0.9);ax.text(0.02,0.95,f"Receita Total: {formatted_revenue}\nTotal de Vendas: {total_sales_count}",transform=ax.transAxes,fontsize=12,verticalalignment='top',color='white',bbox=props);plt.tight_layout(rect=[0,0.03,1,0.95]);buf=io.BytesIO();plt.savefig(buf,format='png',facecolor=fig.get_facecolor());buf.seek(0);plt.close();return buf
+    import numpy as np
+    end_date = datetime.now(timezone.utc); start_date = end_date - timedelta(days=30)
+    # Agregação vetorizada: índice do dia relativo ao início da janela + np.bincount ponderado pelo preço.
+    # O Supabase devolve timestamptz em UTC, então a data (YYYY-MM-DD) é o prefixo da string.
+    # Uma única passada sobre os pedidos preenche data e preço de cada linha
+    orders = np.array([(o['created_at'][:10], PRICES.get(o.get('product_id'), 0.0)) for o in completed_orders], dtype=[('day', 'datetime64[D]'), ('price', np.float64)])
+    day_idx = (orders['day'] - np.datetime64(start_date.date(), 'D')).astype(np.int64)
+    prices = orders['price']
+    mask = (day_idx >= 0) & (day_idx < 31)
+    sales = np.bincount(day_idx[mask], weights=prices[mask], minlength=31)
+    dates = [start_date.date() + timedelta(days=i) for i in range(31)]
+    total_sales_count = len(completed_orders); total_revenue = float(prices.sum())
+    formatted_revenue = f"R$ {total_revenue:,.2f}".replace(',', 'v').replace('.', ',').replace('v', '.')
+    props = dict(boxstyle='round,pad=0.5', facecolor='#23272A', alpha=0.9)
+
+    from matplotlib import style
+    # O estilo escuro vale só durante a renderização (o lock garante que ninguém mais mexe no rcParams)
+    with _DASH_LOCK, style.context('dark_background'):
+        fig, canvas, ax = _get_dashboard_figure()
+        # Só as barras e o quadro de totais mudam entre renderizações
+        # Remover o BarContainer (e não só os retângulos) evita que ax.containers cresça a cada renderização
+        for container in list(ax.containers): container.remove()
+        for artist in list(ax.patches) + list(ax.texts): artist.remove()
+        ax.bar(dates, sales, color='#5865F2', zorder=2)
+        ax.relim(); ax.autoscale_view()
+        ax.text(0.02, 0.95, f"Receita Total: {formatted_revenue}\nTotal de Vendas: {total_sales_count}", transform=ax.transAxes, fontsize=12, verticalalignment='top', color='white', bbox=props)
+        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+        buf = io.BytesIO()
+        canvas.print_png(buf, pil_kwargs={'compress_level': 1})
+    buf.seek(0)
+    return buf
+
+# Resultado da última consulta de pedidos concluídos: (instante da consulta, linhas)
+_COMPLETED_CACHE = (0.0, None)
+COMPLETED_CACHE_TTL = 30
+
+def get_completed_orders() -> list:
+    """Busca os pedidos concluídos (só as colunas usadas pelo dashboard), reaproveitando o resultado por alguns segundos."""
+    global _COMPLETED_CACHE
+    fetched_at, orders = _COMPLETED_CACHE
+    if orders is not None and time.monotonic() - fetched_at < COMPLETED_CACHE_TTL:
+        return orders
+    orders = get_supabase().table('pedidos').select('id,created_at,product_id').eq('status', 'completed').order('id').execute().data
+    _COMPLETED_CACHE = (time.monotonic(), orders)
+    return orders
+
+def invalidate_completed_orders():
+    """Descarta a consulta em cache, p.ex. quando um pedido passa a 'completed'."""
+    global _COMPLETED_CACHE
+    _COMPLETED_CACHE = (0.0, None)
+
+# Última renderização do dashboard: (chave do conjunto de pedidos, PNG, instante da renderização)
+_DASH_CACHE = (None, b"", 0.0)
+DASH_CACHE_TTL = 60
+
+def get_dashboard_image(completed_orders: list) -> io.BytesIO:
+    """Devolve o PNG do dashboard, reaproveitando a última renderização se os pedidos concluídos não mudaram."""
+    global _DASH_CACHE
+    # A chave inclui o dia atual, já que a janela de 30 dias avança com a data
+    key = hashlib.blake2b(b"".join(int(o['id']).to_bytes(8, 'little') for o in completed_orders) + datetime.now(timezone.utc).date().isoformat().encode(), digest_size=16).digest()
+    cached_key, cached_png, cached_ts = _DASH_CACHE
+    if key == cached_key and time.monotonic() - cached_ts < DASH_CACHE_TTL:
+        return io.BytesIO(cached_png)
+    buf = create_dashboard_image(completed_orders)
+    _DASH_CACHE = (key, buf.getvalue(), time.monotonic())
+    return buf
+
 def handle_dashboard_command(interaction: dict):
     token=interaction['token'];followup_url=f"{BASE_DISCORD_API_URL}/webhooks/{DISCORD_APP_ID}/{token}/messages/@original"
     try:
-        res=supabase.table('pedidos').select('*').eq('status','completed').execute()
-        if not res.data:requests.patch(followup_url,json={"content":"ℹ️ Nenhuma venda foi concluída ainda."});return
-        img_buf=create_dashboard_image(res.data);files={'file[0]':('dashboard.png',img_buf,'image/png')};payload_json={"content":""};requests.patch(followup_url,files=files,data={"payload_json":json.dumps(payload_json)})
-    except Exception as e:app.logger.error(f"Erro ao gerar dashboard: {e}");requests.patch(followup_url,json={"content":"❌ Ocorreu um erro ao gerar o dashboard."})
+        completed_orders=get_completed_orders()
+        if not completed_orders:WEBHOOK_SESSION.patch(followup_url,headers=JSON_HEADERS,data=orjson.dumps({"content":"ℹ️ Nenhuma venda foi concluída ainda."}));return
+        img_buf=get_dashboard_image(completed_orders)
+        # O MultipartEncoder lê o PNG direto do buffer enquanto envia, sem montar uma segunda cópia do corpo na memória
+        form=MultipartEncoder(fields={'payload_json':orjson.dumps({"content":""}).decode(),'file[0]':('dashboard.png',img_buf,'image/png')})
+        WEBHOOK_SESSION.patch(followup_url,headers={'Content-Type':form.content_type},data=form)
+    except Exception as e:app.logger.error(f"Erro ao gerar dashboard: {e}");WEBHOOK_SESSION.patch(followup_url,headers=JSON_HEADERS,data=orjson.dumps({"content":"❌ Ocorreu um erro ao gerar o dashboard."}))
 
 # --- Rota Principal de Interações ---
 @app.route('/interactions', methods=['POST'])
 def interactions_handler():
     signature = request.headers.get('X-Signature-Ed25519')
     timestamp = request.headers.get('X-Signature-Timestamp')
-    body = request.data.decode('utf-8')
     if not signature or not timestamp: return 'Missing signature headers', 401
+    # Assinatura Ed25519 em hex tem sempre 128 caracteres; descarta sondagens malformadas antes de qualquer decodificação
+    if len(signature) != 128 or len(timestamp) > 64: return 'Invalid request signature', 401
+    # Verifica a assinatura direto sobre os bytes do corpo, sem decodificar/recodificar UTF-8
+    raw = request.get_data(cache=True)
     try:
-        verify_key.verify(f'{timestamp}{body}'.encode(), bytes.fromhex(signature))
-    except BadSignatureError:
+        verify_key.verify(binascii.unhexlify(signature), timestamp.encode('ascii') + raw)
+    except (InvalidSignature, ValueError):
         return 'Invalid request signature', 401
 
-    interaction = request.json
+    # PING é o único tipo de interação sem "data": responde sem decodificar o corpo
+    if b'"data"' not in raw and (b'"type":1' in raw or b'"type": 1' in raw):
+        return json_bytes(PONG_BYTES)
+
+    interaction = orjson.loads(raw)
     itype = interaction['type']
     
-    if itype == 1: return jsonify({'type': 1})
+    if itype == 1: return json_bytes(PONG_BYTES)
 
     if itype == 2: # Command
         data = interaction['data']
         name = data['name']
         if name == "comprar":
-            # (Lógica do /comprar permanece a mesma)
-            return jsonify({"type": 4, "data": {"embeds": [Embed(title=list(PRODUTOS.values())[0]['name'], color=Color.from_str("#5865F2")).add_field(name="💰 Preço", value=f"**`{list(PRODUTOS.values())[0]['price_display']}`**", inline=True).add_field(name="📦 O que você recebe?", value="Código-fonte completo", inline=True).add_field(name="📄 Descrição", value=list(PRODUTOS.values())[0]['description'], inline=False).set_image(url=list(PRODUTOS.values())[0]['image_url']).set_footer(text=f"Página 1 de {len(PRODUTOS)}").to_dict()], "components": [{"type": 1, "components": [{"type": 2, "style": 3, "label": "Comprar este Item", "emoji": {"name": "🛒"}, "custom_id": f"buy_{list(PRODUTOS.values())[0]['id']}"}]}, {"type": 1, "components": [{"type": 2, "style": 2, "emoji": {"name": "⬅️"}, "custom_id": "catalog_prev_0", "disabled": True}, {"type": 2, "style": 2, "emoji": {"name": "➡️"}, "custom_id": "catalog_next_0", "disabled": len(PRODUTOS) <= 1}]}], "flags": 64}})
+            return json_bytes(COMPRAR_RESPONSE_BYTES)
         
         if name == "pedidos":
             if not is_admin(interaction):
-                return jsonify({"type": 4, "data": {"content": "❌ Você não tem permissão.", "flags": 64}})
-            return jsonify({"type": 4, "data": {**build_pending_orders_view(), "flags": 64}})
+                return json_bytes(NO_PERMISSION_BYTES)
+            return ojson({"type": 4, "data": {**build_pending_orders_view(interaction['member']['user']['id']), "flags": 64}})
 
         if name == "dashboard":
             if not is_admin(interaction):
-                return jsonify({"type": 4, "data": {"content": "❌ Você não tem permissão.", "flags": 64}})
-            threading.Thread(target=handle_dashboard_command, args=(interaction,)).start()
-            return jsonify({"type": 5, "data": {"flags": 64}})
+                return json_bytes(NO_PERMISSION_BYTES)
+            return defer(DEFERRED_MESSAGE_BYTES, handle_dashboard_command, interaction, executor=DASHBOARD_EXECUTOR)
 
     if itype == 3: # Component
         custom_id = interaction['data']['custom_id']
-        if custom_id.startswith("catalog_"):
-            # (Lógica da navegação do catálogo permanece a mesma)
-            parts=custom_id.split('_');action=parts[1];page=int(parts[2]);new_page=page+(1 if action=="next" else -1);products_list=list(PRODUTOS.values());new_page=max(0,min(new_page,len(products_list)-1));product=products_list[new_page];embed=Embed(title=product['name'],color=Color.from_str("#5865F2")).add_field(name="💰 Preço",value=f"**`{product['price_display']}`**",inline=True).add_field(name="📦 O que você recebe?",value="Código-fonte completo",inline=True).add_field(name="📄 Descrição",value=product['description'],inline=False).set_image(url=product['image_url']).set_footer(text=f"Página {new_page+1} de {len(products_list)}");return jsonify({"type":7,"data":{"embeds":[embed.to_dict()],"components":[{"type":1,"components":[{"type":2,"style":3,"label":"Comprar este Item","emoji":{"name":"🛒"},"custom_id":f"buy_{product['id']}"}]},{"type":1,"components":[{"type":2,"style":2,"emoji":{"name":"⬅️"},"custom_id":f"catalog_prev_{new_page}","disabled":new_page==0},{"type":2,"style":2,"emoji":{"name":"➡️"},"custom_id":f"catalog_next_{new_page}","disabled":new_page>=len(products_list)-1}]}]}})
+        nav_response = CATALOG_NAV.get(custom_id)
+        if nav_response is not None:
+            return json_bytes(nav_response)
+
+        # O custom_id é decomposto uma única vez aqui; os handlers já recebem os argumentos convertidos
+        prefix, _, rest = custom_id.partition('_')
+        if prefix == "catalog":
+            action, _, page = rest.partition('_')
+            new_page = int(page) + (1 if action == "next" else -1)
+            new_page = max(0, min(new_page, len(CATALOG_PAGES) - 1))
+            return json_bytes(CATALOG_PAGES_BYTES[new_page])
         
-        if custom_id.startswith("buy_"):
-            threading.Thread(target=handle_buy_action, args=(interaction,)).start()
-            return jsonify({"type": 5, "data": {"flags": 64}})
+        if prefix == "buy":
+            return defer(DEFERRED_MESSAGE_BYTES, handle_buy_action, interaction, rest)
 
-        if custom_id.startswith("pedidos_"):
-            action = custom_id.split('_')[1]
+        if prefix == "pedidos":
+            action, *args = rest.split('_')
             if action in ["prev", "next"]:
-                page = int(custom_id.split('_')[2])
-                new_page = page + (1 if action == "next" else -1)
-                return jsonify({"type": 7, "data": build_pending_orders_view(page=new_page)})
+                new_page = int(args[0]) + (1 if action == "next" else -1)
+                return ojson({"type": 7, "data": build_pending_orders_view(interaction['member']['user']['id'], page=new_page)})
             
             if action == "confirm":
-                threading.Thread(target=handle_confirm_order, args=(interaction,)).start()
-                return jsonify({"type": 6}) # DEFERRED_UPDATE_MESSAGE
+                return defer(DEFERRED_UPDATE_BYTES, handle_confirm_order, interaction, int(args[0]), int(args[1])) # DEFERRED_UPDATE_MESSAGE
             
             if action == "cancel":
-                threading.Thread(target=handle_cancel_order, args=(interaction,)).start()
-                return jsonify({"type": 6}) # DEFERRED_UPDATE_MESSAGE
+                return defer(DEFERRED_UPDATE_BYTES, handle_cancel_order, interaction, int(args[0]), int(args[1])) # DEFERRED_UPDATE_MESSAGE
 
-    return jsonify({"type": 4, "data": {"content": "Interação não reconhecida.", "flags": 64}})
+    return json_bytes(UNKNOWN_INTERACTION_BYTES)
 
 @app.route('/')
 def home(): return "O bot de vendas está operando."
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------
+# Configuração do gunicorn (carregada automaticamente por `gunicorn app:app`)
+# -----------------------------------------------------------------
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Workers com threads: cada worker atende várias interações ao mesmo tempo enquanto
+# o trabalho pesado (chamadas ao Discord/Supabase) segue no ThreadPoolExecutor do app.
+worker_class = "gthread"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))